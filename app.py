@@ -1,40 +1,163 @@
-from flask import Flask, render_template, request, redirect, url_for
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
+from flask import (Flask, Response, abort, jsonify, render_template, request, redirect, stream_template,
+                   stream_with_context, url_for)
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+import json
 import os
 
+from cache import LRUCache
+from metrics import Metrics, SlowRequestProfiler
+from page_cache import PageCache
+from passwords import PasswordHasher
+from search import SearchIndex
+from storage import TicketStore, User, UserStore
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default_secret_key')  # Загрузка из переменной окружения
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 
+# Метрики для /metrics; PROFILE_EVERY=N включает профилирование каждого N-го
+# запроса с сохранением профилей самых медленных в PROFILE_DIR
+PROFILE_EVERY = int(os.getenv('PROFILE_EVERY', '0'))
+metrics = Metrics(SlowRequestProfiler(os.getenv('PROFILE_DIR', 'profiles'), every=PROFILE_EVERY,
+                                      keep=int(os.getenv('PROFILE_KEEP', '10'))) if PROFILE_EVERY else None)
+metrics.init_app(app)
+
+# Размер страницы списка заявок по умолчанию и верхняя граница для ?limit=
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+TICKET_STATUSES = ('open', 'in progress', 'closed')
+# Поля заявки, которые можно передать через API
+TICKET_FIELDS = ('title', 'description', 'status')
+
+# Наибольшее число элементов в одном запросе к /api/tickets/bulk
+MAX_BULK_ITEMS = 5000
+
+
+# Пароли хэшируются медленным KDF в отдельном пуле ('thread' или 'process'),
+# чтобы всплеск входов не занимал все потоки сервера
+password_hasher = PasswordHasher(method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+                                 cost=int(os.getenv('PASSWORD_HASH_COST', '0')) or None,
+                                 pool=os.getenv('PASSWORD_POOL', 'thread'),
+                                 workers=int(os.getenv('PASSWORD_POOL_WORKERS', '2')),
+                                 cache_ttl=float(os.getenv('PASSWORD_VERIFY_CACHE_TTL', '60')))
+
+
+def seed_password(name):
+    password = os.getenv(name)
+    return password_hasher.hash(password) if password is not None else None
+
+
+# Хранилище: 'memory' (по умолчанию, данные живут в процессе) или 'sqlite'
+# (общая база для нескольких воркеров)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'memory')
+
+if STORAGE_BACKEND == 'sqlite':
+    from sqlite_storage import SQLiteDatabase, SQLiteTicketStore, SQLiteUserStore
 
-class User(UserMixin):
-    def __init__(self, id, username, password, role):
-        self.id = id
-        self.username = username
-        self.password = password
-        self.role = role
+    database = SQLiteDatabase(os.getenv('SQLITE_PATH', 'helpdesk.db'),
+                              pool_size=int(os.getenv('SQLITE_POOL_SIZE', '16')))
+    users = SQLiteUserStore(database)
+    tickets = SQLiteTicketStore(database)
 
-    def get_id(self):
-        return str(self.id)
+    # Соединение возвращается в пул в конце запроса (для потокового ответа —
+    # после отправки последней части)
+    @app.teardown_appcontext
+    def release_connection(exception):
+        database.release()
+else:
+    users = UserStore()
+    tickets = TicketStore()
 
+users = metrics.instrument(users, 'users')
+tickets = metrics.instrument(tickets, 'tickets')
 
-users = [
-    User(id=1, username='user1', password=os.getenv('USER1_PASSWORD'), role='user'),
-    User(id=2, username='admin', password=os.getenv('ADMIN_PASSWORD'), role='admin')
-]
 
+users.seed([
+    User(id=1, username='user1', password=seed_password('USER1_PASSWORD'), role='user'),
+    User(id=2, username='admin', password=seed_password('ADMIN_PASSWORD'), role='admin')
+])
 
-tickets = [
+
+tickets.seed([
     {'id': 1, 'title': 'Не работает интернет', 'description': 'Скорость ниже заявленной.', 'status': 'open', 'author': 'user1'},
     {'id': 2, 'title': 'Проблема с компьютером', 'description': 'Не включается ноутбук.', 'status': 'in progress', 'author': 'user1'},
-]
+])
+
+
+# Поисковый индекс в памяти строится при старте и дальше обновляется при
+# каждом изменении заявки. SQLite ищет сам по FTS5-таблице, которую
+# обновляют триггеры, поэтому индекс нужен только хранилищу в памяти
+search_index = None if STORAGE_BACKEND == 'sqlite' else metrics.instrument(SearchIndex(tickets), 'search')
+
+
+# Кэш страниц заявок. Версии данных хранятся в памяти процесса, поэтому для
+# SQLite, где пишут несколько воркеров, кэш по умолчанию выключен
+page_cache = PageCache(maxsize=int(os.getenv('PAGE_CACHE_SIZE', '0' if STORAGE_BACKEND == 'sqlite' else '256')))
+
+
+# Flask-Login загружает пользователя на каждом запросе; кэш избавляет от
+# обращения к хранилищу. Смену роли или пароля в другом воркере он бы не
+# увидел до истечения TTL (разжалованный админ оставался бы админом),
+# поэтому для SQLite кэш по умолчанию выключен
+user_cache = LRUCache(maxsize=int(os.getenv('USER_CACHE_SIZE', '0' if STORAGE_BACKEND == 'sqlite' else '1024')),
+                      ttl=float(os.getenv('USER_CACHE_TTL', '5')))
+
+
+def cache_stats(attribute):
+    caches = {'user': user_cache, 'page': page_cache.pages, 'password': password_hasher.verified}
+    return [((name,), getattr(cache, attribute)) for name, cache in caches.items() if cache is not None]
+
+
+metrics.add('tickets_total', 'Number of stored tickets.', 'gauge', lambda: [((), len(tickets))])
+metrics.add('users_total', 'Number of registered users.', 'gauge', lambda: [((), len(users))])
+metrics.add('cache_hits_total', 'Cache hits.', 'counter', lambda: cache_stats('hits'), ('cache',))
+metrics.add('cache_misses_total', 'Cache misses.', 'counter', lambda: cache_stats('misses'), ('cache',))
+metrics.add('page_not_modified_total', 'Responses answered with 304 Not Modified.', 'counter',
+            lambda: [((), page_cache.not_modified)])
+
+
+def can_modify(ticket):
+    """Заявку может смотреть и менять её автор или администратор."""
+    return ticket['author'] == current_user.username or current_user.role == 'admin'
+
+
+def list_filters():
+    """Курсор, размер страницы и фильтры списка заявок из строки запроса.
+
+    Админ может фильтровать по автору, пользователь видит только свои
+    заявки; возвращает (after, limit, status, author).
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    status = request.args.get('status') or None
+    author = (request.args.get('author') or None) if current_user.role == 'admin' else current_user.username
+    return after, limit, status, author
+
+
+def ticket_changed(ticket):
+    if search_index is not None:
+        search_index.add(ticket)
+    page_cache.bump(ticket['author'])
+
+
+def ticket_deleted(ticket):
+    if search_index is not None:
+        search_index.remove(ticket['id'])
+    page_cache.bump(ticket['author'])
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return next((user for user in users if user.id == int(user_id)), None)
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = users.get(user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -42,9 +165,12 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = next((user for user in users if user.username == username), None)
+        user = users.get_by_username(username)
 
-        if user and user.password == password:
+        if password_hasher.verify(user.password if user else None, password):
+            if password_hasher.needs_rehash(user.password):
+                users.set_password(user.id, password_hasher.hash(password))
+                user_cache.pop(user.id)
             login_user(user)
             return redirect(url_for('index'))
 
@@ -70,11 +196,12 @@ def register():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        if any(user.username == username for user in users):
+        if users.get_by_username(username) is not None:
+            return redirect(url_for('register'))
+
+        if users.create(username, password_hasher.hash(password)) is None:
             return redirect(url_for('register'))
 
-        new_user = User(id=len(users) + 1, username=username, password=password, role='user')
-        users.append(new_user)
         return redirect(url_for('login'))
 
     return render_template('register.html')
@@ -83,25 +210,59 @@ def register():
 @app.route('/tickets')
 @login_required
 def view_tickets():
-    if current_user.role == 'admin':
-        return render_template('view_tickets.html', tickets=tickets, current_user=current_user)
+    after, limit, status, author = list_filters()
+    # В ссылках страницы фильтр по автору нужен только админу
+    author_filter = author if current_user.role == 'admin' else None
+    filters = {'limit': limit, 'status': status, 'author': author_filter}
+
+    # Потоковый режим: все подходящие заявки без разбиения на страницы, HTML
+    # отдаётся по мере рендеринга шаблона
+    if request.args.get('stream'):
+        return Response(stream_template('view_tickets.html', tickets=tickets.scan(after, author, status),
+                                        next_cursor=None, filters=filters, current_user=current_user))
+
+    def render():
+        page = tickets.page(after=after, limit=limit + 1, author=author, status=status)
+        next_cursor = page[limit - 1]['id'] if len(page) > limit else None
+        return render_template('view_tickets.html', tickets=page[:limit], next_cursor=next_cursor,
+                               filters=filters, current_user=current_user)
+
+    version = page_cache.version(None if current_user.role == 'admin' else current_user.username)
+    key = ('tickets', current_user.username, current_user.role, after, limit, status, author_filter, version)
+    return page_cache.respond(key, render)
+
 
-    user_tickets = [ticket for ticket in tickets if ticket['author'] == current_user.username]
-    return render_template('view_tickets.html', tickets=user_tickets, current_user=current_user)
+@app.route('/tickets/search')
+@login_required
+def search_tickets():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    author = None if current_user.role == 'admin' else current_user.username
+
+    results = []
+    searcher = tickets if search_index is None else search_index
+    for ticket_id in searcher.search(query, author=author, limit=limit):
+        ticket = tickets.get(ticket_id)
+        if ticket is not None:
+            results.append(ticket)
+
+    return render_template('search_tickets.html', query=query, tickets=results, current_user=current_user)
 
 
 @app.route('/tickets/<int:ticket_id>', methods=['GET'])
 @login_required
 def view_ticket(ticket_id):
-    ticket = next((ticket for ticket in tickets if ticket['id'] == ticket_id), None)
+    ticket = tickets.get(ticket_id)
 
     if ticket is None:
         return redirect(url_for('view_tickets'))
 
-    if ticket['author'] != current_user.username and current_user.role != 'admin':
+    if not can_modify(ticket):
         return redirect(url_for('view_tickets'))
 
-    return render_template('view_ticket.html', ticket=ticket, current_user=current_user)
+    key = ('ticket', ticket_id, current_user.username, current_user.role, page_cache.version(ticket['author']))
+    return page_cache.respond(
+        key, lambda: render_template('view_ticket.html', ticket=ticket, current_user=current_user))
 
 
 @app.route('/tickets/create', methods=['GET', 'POST'])
@@ -110,14 +271,7 @@ def create_ticket():
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
-        new_ticket = {
-            'id': len(tickets) + 1,
-            'title': title,
-            'description': description,
-            'status': 'open',
-            'author': current_user.username
-        }
-        tickets.append(new_ticket)
+        ticket_changed(tickets.create(title, description, current_user.username))
         return redirect(url_for('view_tickets'))
 
     return render_template('create_ticket.html', current_user=current_user)
@@ -126,19 +280,25 @@ def create_ticket():
 @app.route('/tickets/edit/<int:ticket_id>', methods=['GET', 'POST'])
 @login_required
 def update_ticket(ticket_id):
-    ticket = next((ticket for ticket in tickets if ticket['id'] == ticket_id), None)
+    ticket = tickets.get(ticket_id)
     if not ticket:
         return redirect(url_for('view_tickets'))
 
-    if ticket['author'] != current_user.username and current_user.role != 'admin':
+    if not can_modify(ticket):
         return redirect(url_for('view_tickets'))
 
     if request.method == 'POST':
-        ticket['title'] = request.form['title']
-        ticket['description'] = request.form['description']
+        fields = {
+            'title': request.form['title'],
+            'description': request.form['description']
+        }
 
         if current_user.role == 'admin':
-            ticket['status'] = request.form['status']
+            fields['status'] = request.form['status']
+
+        ticket = tickets.update(ticket_id, **fields)
+        if ticket is not None:
+            ticket_changed(ticket)
 
         return redirect(url_for('view_tickets'))
 
@@ -148,17 +308,27 @@ def update_ticket(ticket_id):
 @app.route('/tickets/delete/<int:ticket_id>', methods=['POST'])
 @login_required
 def delete_ticket(ticket_id):
-    ticket = next((ticket for ticket in tickets if ticket['id'] == ticket_id), None)
+    ticket = tickets.get(ticket_id)
     if not ticket:
         return redirect(url_for('view_tickets'))
 
-    if ticket['author'] != current_user.username and current_user.role != 'admin':
+    if not can_modify(ticket):
         return redirect(url_for('view_tickets'))
 
-    tickets.remove(ticket)
+    if tickets.delete(ticket_id) is not None:
+        ticket_deleted(ticket)
     return redirect(url_for('view_tickets'))
 
 
+@app.route('/metrics')
+@login_required
+def metrics_endpoint():
+    if current_user.role != 'admin':
+        abort(403)
+
+    return Response(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/users', methods=['GET', 'POST'])
 @login_required
 def manage_users():
@@ -169,11 +339,12 @@ def manage_users():
         user_id = int(request.form.get('user_id'))
         new_role = request.form.get('role')
 
-        user = next((user for user in users if user.id == user_id), None)
-        if user:
-            user.role = new_role
+        user = users.set_role(user_id, new_role)
+        user_cache.pop(user_id)
+        if user is not None:
+            page_cache.bump(user.username)
 
-    return render_template('view_users.html', users=users, current_user=current_user)
+    return render_template('view_users.html', users=users.all(), current_user=current_user)
 
 
 @app.route('/users/update_role/<int:user_id>', methods=['POST'])
@@ -182,12 +353,228 @@ def update_user_role(user_id):
     if current_user.role != 'admin':
         return redirect(url_for('manage_users'))
 
-    user = next((user for user in users if user.id == user_id), None)
+    user = users.get(user_id)
     if not user:
         return redirect(url_for('manage_users'))
 
     new_role = request.form.get('role')
     if new_role in ['user', 'admin']:
-        user.role = new_role
+        users.set_role(user.id, new_role)
+        user_cache.pop(user.id)
+        page_cache.bump(user.username)
 
     return redirect(url_for('manage_users'))
+
+
+# JSON API для интеграций: те же правила доступа, что и у HTML-страниц, плюс
+# пакетные операции, которые применяются целиком или не применяются вовсе
+
+def api_error(message, status=400, index=None):
+    body = {'error': message}
+    if index is not None:
+        body['index'] = index
+    return jsonify(body), status
+
+
+def ticket_fields(data, partial):
+    """Проверяет поля заявки из JSON; возвращает (поля, ошибка)."""
+    if not isinstance(data, dict):
+        return None, 'Ticket must be an object'
+
+    unknown = sorted(set(data) - set(TICKET_FIELDS))
+    if unknown:
+        return None, 'Unknown fields: %s' % ', '.join(unknown)
+
+    fields = {}
+    for name in ('title', 'description'):
+        if name in data:
+            if not isinstance(data[name], str) or not data[name].strip():
+                return None, '%s must be a non-empty string' % name
+            fields[name] = data[name]
+        elif not partial:
+            return None, '%s is required' % name
+
+    if 'status' in data:
+        if not partial:
+            return None, 'status cannot be set when creating a ticket'
+        if current_user.role != 'admin':
+            return None, 'Only admins can change status'
+        if data['status'] not in TICKET_STATUSES:
+            return None, 'status must be one of: %s' % ', '.join(TICKET_STATUSES)
+        fields['status'] = data['status']
+
+    return fields, None
+
+
+def bulk_items(data, key):
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, api_error('%s must be a non-empty array' % key)
+    if len(items) > MAX_BULK_ITEMS:
+        return None, api_error('At most %d items per request' % MAX_BULK_ITEMS)
+    return items, None
+
+
+def modifiable_ticket(ticket_id, index=None):
+    """Заявка, которую текущий пользователь может менять, или ответ с ошибкой."""
+    # bool — подкласс int, но true/false в JSON не считаются id
+    valid_id = isinstance(ticket_id, int) and not isinstance(ticket_id, bool)
+    ticket = tickets.get(ticket_id) if valid_id else None
+    if ticket is None:
+        return None, api_error('Ticket %r not found' % (ticket_id,), 404, index)
+    if not can_modify(ticket):
+        return None, api_error('Ticket %d belongs to another user' % ticket_id, 403, index)
+    return ticket, None
+
+
+@app.route('/api/tickets', methods=['GET'])
+@login_required
+def api_list_tickets():
+    after, limit, status, author = list_filters()
+
+    page = tickets.page(after=after, limit=limit + 1, author=author, status=status)
+    next_cursor = page[limit - 1]['id'] if len(page) > limit else None
+    return jsonify({'tickets': page[:limit], 'next_cursor': next_cursor})
+
+
+@app.route('/api/tickets/export', methods=['GET'])
+@login_required
+def api_export_tickets():
+    after, _, status, author = list_filters()
+
+    def generate():
+        for ticket in tickets.scan(after, author, status):
+            yield json.dumps(ticket, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/tickets', methods=['POST'])
+@login_required
+def api_create_ticket():
+    fields, error = ticket_fields(request.get_json(silent=True), partial=False)
+    if error:
+        return api_error(error)
+
+    ticket = tickets.create(fields['title'], fields['description'], current_user.username)
+    ticket_changed(ticket)
+    return jsonify(ticket), 201
+
+
+@app.route('/api/tickets/<int:ticket_id>', methods=['GET'])
+@login_required
+def api_get_ticket(ticket_id):
+    ticket, error = modifiable_ticket(ticket_id)
+    if error:
+        return error
+    return jsonify(ticket)
+
+
+@app.route('/api/tickets/<int:ticket_id>', methods=['PATCH'])
+@login_required
+def api_update_ticket(ticket_id):
+    ticket, error = modifiable_ticket(ticket_id)
+    if error:
+        return error
+
+    fields, error = ticket_fields(request.get_json(silent=True), partial=True)
+    if error:
+        return api_error(error)
+
+    ticket = tickets.update(ticket_id, **fields)
+    if ticket is None:
+        return api_error('Ticket %d not found' % ticket_id, 404)
+
+    ticket_changed(ticket)
+    return jsonify(ticket)
+
+
+@app.route('/api/tickets/<int:ticket_id>', methods=['DELETE'])
+@login_required
+def api_delete_ticket(ticket_id):
+    ticket, error = modifiable_ticket(ticket_id)
+    if error:
+        return error
+
+    if tickets.delete(ticket_id) is not None:
+        ticket_deleted(ticket)
+    return '', 204
+
+
+@app.route('/api/tickets/bulk', methods=['POST'])
+@login_required
+def api_bulk_create_tickets():
+    items, error = bulk_items(request.get_json(silent=True), 'tickets')
+    if error:
+        return error
+
+    new_tickets = []
+    for index, item in enumerate(items):
+        fields, error = ticket_fields(item, partial=False)
+        if error:
+            return api_error(error, index=index)
+        new_tickets.append({'title': fields['title'], 'description': fields['description'],
+                            'author': current_user.username})
+
+    created = tickets.create_many(new_tickets)
+    for ticket in created:
+        ticket_changed(ticket)
+    return jsonify({'tickets': created}), 201
+
+
+@app.route('/api/tickets/bulk', methods=['PATCH'])
+@login_required
+def api_bulk_update_tickets():
+    items, error = bulk_items(request.get_json(silent=True), 'tickets')
+    if error:
+        return error
+
+    updates = []
+    seen = set()
+    for index, item in enumerate(items):
+        ticket_id = item.get('id') if isinstance(item, dict) else None
+        _, error = modifiable_ticket(ticket_id, index)
+        if error:
+            return error
+
+        if ticket_id in seen:
+            return api_error('Duplicate ticket id %d' % ticket_id, index=index)
+        seen.add(ticket_id)
+
+        fields, error = ticket_fields({name: value for name, value in item.items() if name != 'id'},
+                                      partial=True)
+        if error:
+            return api_error(error, index=index)
+        updates.append((ticket_id, fields))
+
+    updated = tickets.update_many(updates)
+    if updated is None:
+        return api_error('Some tickets were deleted concurrently, nothing was changed', 409)
+
+    for ticket in updated:
+        ticket_changed(ticket)
+    return jsonify({'tickets': updated})
+
+
+@app.route('/api/tickets/bulk', methods=['DELETE'])
+@login_required
+def api_bulk_delete_tickets():
+    ticket_ids, error = bulk_items(request.get_json(silent=True), 'ids')
+    if error:
+        return error
+
+    for index, ticket_id in enumerate(ticket_ids):
+        _, error = modifiable_ticket(ticket_id, index)
+        if error:
+            return error
+
+    if len(set(ticket_ids)) != len(ticket_ids):
+        return api_error('ids must be unique')
+
+    deleted = tickets.delete_many(ticket_ids)
+    if deleted is None:
+        return api_error('Some tickets were deleted concurrently, nothing was changed', 409)
+
+    for ticket in deleted:
+        ticket_deleted(ticket)
+    return jsonify({'deleted': [ticket['id'] for ticket in deleted]})
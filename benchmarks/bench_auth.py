@@ -0,0 +1,64 @@
+"""Накладные расходы аутентификации на запрос при большом числе пользователей.
+
+Запуск: python benchmarks/bench_auth.py [100000]
+
+Сравнивает загрузку пользователя перебором списка (как было раньше) с
+поиском в UserStore и с load_user через LRU-кэш, а также замеряет
+полный запрос к главной странице и вход в систему. Пароли хранятся как
+scrypt-хэши, а кэш проверок паролей выключен, так что вход каждый раз
+проходит полную проверку.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('USER1_PASSWORD', 'bench')
+os.environ.setdefault('ADMIN_PASSWORD', 'bench')
+os.environ.setdefault('PASSWORD_VERIFY_CACHE_TTL', '0')
+
+import app as ticket_app  # noqa: E402
+
+REPEAT = 500
+# Каждый вход считает KDF, поэтому замеров меньше
+LOGIN_REPEAT = 50
+
+
+def measure(call, repeat=REPEAT):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main(count):
+    password = os.environ['USER1_PASSWORD']
+    # Один хэш на всех: иначе заполнение упрётся в KDF
+    hashed = ticket_app.password_hasher.hash(password)
+    for i in range(count):
+        ticket_app.users.create('bench%d' % i, hashed)
+
+    last = ticket_app.users.get_by_username('bench%d' % (count - 1))
+    user_list = ticket_app.users.all()
+    client = ticket_app.app.test_client()
+    form = {'username': last.username, 'password': password}
+    client.post('/login', data=form)
+
+    results = {
+        'list scan (old load_user)': measure(lambda: next(u for u in user_list if u.id == last.id)),
+        'UserStore.get': measure(lambda: ticket_app.users.get(last.id)),
+        'load_user (LRU)': measure(lambda: ticket_app.load_user(str(last.id))),
+        'GET / (authenticated)': measure(lambda: client.get('/')),
+        'POST /login': measure(lambda: client.post('/login', data=form), LOGIN_REPEAT),
+    }
+
+    print('%d users' % len(ticket_app.users))
+    for name, value in results.items():
+        print('%-28s %12.2f us' % (name, value))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
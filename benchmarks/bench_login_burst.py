@@ -0,0 +1,115 @@
+"""Задержка /tickets во время всплеска входов в систему.
+
+Запуск: python benchmarks/bench_login_burst.py [--readers 4] [--burst 16] [--duration 3]
+        [--pool thread|process] [--workers 2]
+
+Приложение запускается в отдельном процессе на локальном WSGI-сервере.
+Несколько потоков непрерывно запрашивают /tickets; сначала без нагрузки,
+затем параллельно со всплеском POST /login с неверным паролем (такие
+проверки не попадают в кэш и каждый раз считают KDF). Для обеих фаз
+выводятся p50/p95/p99 задержки /tickets.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+import urllib.parse
+
+PASSWORD = 'bench'  # nosec B105 - пароль тестового пользователя
+
+
+def serve(port_queue, pool, workers):
+    os.environ.update(USER1_PASSWORD=PASSWORD, ADMIN_PASSWORD=PASSWORD,
+                      PASSWORD_POOL=pool, PASSWORD_POOL_WORKERS=str(workers))
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import app as ticket_app
+    from wsgi_server import run_server
+
+    run_server(ticket_app, port_queue.put)
+
+
+def request(port, method, path, body=None, cookie=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    if cookie:
+        headers['Cookie'] = cookie
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response
+
+
+def login(port, password):
+    body = urllib.parse.urlencode({'username': 'user1', 'password': password})
+    return request(port, 'POST', '/login', body)
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return {'p50': float('nan'), 'p95': float('nan'), 'p99': float('nan')}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def run_phase(port, cookie, readers, burst, duration):
+    stop = threading.Event()
+    latencies = []
+    logins = []
+
+    def read():
+        while not stop.is_set():
+            start = time.perf_counter()
+            request(port, 'GET', '/tickets', cookie=cookie)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    def hammer(n):
+        while not stop.is_set():
+            start = time.perf_counter()
+            login(port, 'wrong-%d' % n)
+            logins.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=read) for _ in range(readers)]
+    threads += [threading.Thread(target=hammer, args=(n,)) for n in range(burst)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, logins
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--burst', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue, args.pool, args.workers))
+    server.start()
+    port = port_queue.get(timeout=60)
+
+    try:
+        cookie = login(port, PASSWORD).getheader('Set-Cookie').split(';', 1)[0]
+        for name, burst in (('idle', 0), ('login burst', args.burst)):
+            latencies, logins = run_phase(port, cookie, args.readers, burst, args.duration)
+            stats = percentiles(latencies)
+            print('%-12s /tickets: %5d req  p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms   logins: %d' % (
+                name, len(latencies), stats['p50'], stats['p95'], stats['p99'], len(logins)))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
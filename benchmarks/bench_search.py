@@ -0,0 +1,107 @@
+"""Поиск по инвертированному индексу и FTS5 против перебора подстрок.
+
+Запуск: python benchmarks/bench_search.py [1000000]
+
+Проверяет, что словоформы слов из демо-заявок стеммятся одинаково, затем
+генерирует заявки из русского словаря, строит SearchIndex (хранилище в
+памяти) и FTS5-индекс во временной базе SQLite и печатает медиану и
+максимум времени каждого запроса для администратора и для одного автора
+рядом с наивным поиском подстроки по всем заявкам.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import SearchIndex, stem  # noqa: E402
+from sqlite_storage import SQLiteDatabase, SQLiteTicketStore  # noqa: E402
+
+WORDS = (
+    'интернет', 'компьютер', 'ноутбук', 'принтер', 'монитор', 'сеть', 'пароль', 'почта', 'сервер',
+    'скорость', 'ошибка', 'доступ', 'диск', 'клавиатура', 'мышь', 'телефон', 'камера', 'звук',
+    'обновление', 'драйвер', 'вирус', 'лицензия', 'картридж', 'кабель', 'роутер', 'бухгалтерия',
+    'отчёт', 'таблица', 'документ', 'программа', 'окно', 'экран', 'питание', 'батарея', 'зарядка',
+)
+FORMS = ('', 'а', 'у', 'ом', 'ы', 'ов')
+VERBS = ('не работает', 'не включается', 'тормозит', 'зависает', 'шумит', 'сломался', 'пропал')
+QUERIES = ('ноутбук', 'принтер картридж', 'пароль почта', 'роутер кабель', 'бухгалтерия отчёт', 'вирус')
+REPEAT = 50
+
+# Словоформы слов из демо-заявок, которые должны сводиться к одной основе
+STEM_GROUPS = (
+    ('интернет', 'интернета', 'интернету', 'интернетом', 'интернете'),
+    ('компьютер', 'компьютера', 'компьютером', 'компьютеры', 'компьютеров'),
+    ('ноутбук', 'ноутбука', 'ноутбуку', 'ноутбуком', 'ноутбуки'),
+    ('скорость', 'скорости', 'скоростью'),
+    ('работает', 'работать', 'работают', 'работал'),
+    ('включается', 'включаться', 'включаются'),
+    ('заявленной', 'заявленная', 'заявленный'),
+)
+
+
+def make_tickets(count, rng):
+    for ticket_id in range(1, count + 1):
+        title = '%s%s %s' % (rng.choice(WORDS), rng.choice(FORMS), rng.choice(VERBS))
+        description = ' '.join(rng.choice(WORDS) + rng.choice(FORMS) for _ in range(8))
+        yield {'id': ticket_id, 'title': title, 'description': description,
+               'status': 'open', 'author': 'user%d' % rng.randrange(1000)}
+
+
+def naive_search(tickets, query):
+    words = query.lower().split()
+    return [ticket['id'] for ticket in tickets
+            if all(word in (ticket['title'] + ' ' + ticket['description']).lower() for word in words)]
+
+
+def check_stemming():
+    for forms in STEM_GROUPS:
+        stems = {stem(form) for form in forms}
+        if len(stems) != 1:
+            raise SystemExit('Different stems for %s: %s' % (', '.join(forms), ', '.join(sorted(stems))))
+
+
+def measure(call, query, repeat=REPEAT):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def report(name, call, repeat=REPEAT):
+    for query in QUERIES:
+        median, worst = measure(call, query, repeat)
+        print('%-16s %-20s median %10.3f ms   max %10.3f ms' % (name, query, median, worst))
+
+
+def main(count):
+    check_stemming()
+    tickets = list(make_tickets(count, random.Random(42)))  # nosec B311 - синтетические данные
+
+    start = time.perf_counter()
+    index = SearchIndex(tickets)
+    print('%d tickets, index built in %.1f s' % (count, time.perf_counter() - start))
+    report('index (admin)', lambda q: index.search(q))
+    report('index (author)', lambda q: index.search(q, author='user1'))
+    del index
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = SQLiteDatabase(os.path.join(directory, 'search.db'))
+        store = SQLiteTicketStore(database)
+        start = time.perf_counter()
+        store.seed(tickets)
+        print('FTS5 index built in %.1f s' % (time.perf_counter() - start))
+        report('fts5 (admin)', lambda q: store.search(q))
+        report('fts5 (author)', lambda q: store.search(q, author='user1'))
+        database.close()
+
+    report('naive scan', lambda q: naive_search(tickets, q), 1)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
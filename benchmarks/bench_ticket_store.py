@@ -0,0 +1,73 @@
+"""Задержка запросов к заявкам при росте хранилища.
+
+Запуск: python benchmarks/bench_ticket_store.py [1000 10000 100000 1000000]
+
+Для каждого размера хранилище приложения дополняется заявками постороннего
+автора (через обёртку с метриками и поисковый индекс, как при обычной
+работе), после чего через тестовый клиент Flask замеряются просмотр,
+редактирование и удаление заявки, а также список заявок user1. Кэш страниц
+выключен, чтобы замерять само хранилище. При индексированном хранилище
+медиана не должна зависеть от числа заявок.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('USER1_PASSWORD', 'bench')
+os.environ.setdefault('ADMIN_PASSWORD', 'bench')
+os.environ.setdefault('PAGE_CACHE_SIZE', '0')
+
+import app as ticket_app  # noqa: E402
+
+REPEAT = 200
+
+
+def seed(size):
+    """Дополняет хранилище приложения до size заявок."""
+    start = len(ticket_app.tickets)
+    items = [{'title': 'Заявка %d' % i, 'description': 'Описание заявки %d' % i, 'author': 'bench'}
+             for i in range(start, size)]
+    for ticket in ticket_app.tickets.create_many(items):
+        ticket_app.ticket_changed(ticket)
+
+
+def measure(call):
+    samples = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        call(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run(size):
+    seed(size)
+    own_ids = []
+    for _ in range(REPEAT):
+        ticket = ticket_app.tickets.create('Моя заявка', 'Описание', 'user1')
+        ticket_app.ticket_changed(ticket)
+        own_ids.append(ticket['id'])
+    client = ticket_app.app.test_client()
+    client.post('/login', data={'username': 'user1', 'password': os.environ['USER1_PASSWORD']})
+
+    return {
+        'view': measure(lambda i: client.get('/tickets/%d' % own_ids[i])),
+        'edit': measure(lambda i: client.post('/tickets/edit/%d' % own_ids[i],
+                                              data={'title': 'Изменено', 'description': 'Описание'})),
+        'list': measure(lambda i: client.get('/tickets')),
+        'delete': measure(lambda i: client.post('/tickets/delete/%d' % own_ids[i])),
+    }
+
+
+def main(sizes):
+    print('%10s %10s %10s %10s %10s' % ('tickets', 'view ms', 'edit ms', 'list ms', 'delete ms'))
+    for size in sizes:
+        result = run(size)
+        print('%10d %10.3f %10.3f %10.3f %10.3f' % (
+            size, result['view'], result['edit'], result['list'], result['delete']))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000, 1000000])
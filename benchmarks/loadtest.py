@@ -0,0 +1,370 @@
+"""Нагрузочный тест всех маршрутов приложения со смешанной нагрузкой.
+
+Запуск:
+    python benchmarks/loadtest.py --users 100 --tickets 10000 --concurrency 8 --duration 10 \\
+        --output run.json
+    python benchmarks/loadtest.py ... --compare run.json
+
+Создаёт N пользователей и M заявок, затем `--concurrency` потоков в течение
+`--duration` секунд (или `--requests` запросов на поток) выполняют случайные
+операции с весами из `--mix`: вход, список, просмотр, поиск, создание,
+редактирование, удаление заявок и смену ролей. Приложение вызывается через
+тестовый клиент Flask (`--transport client`) или через локальный
+WSGI-сервер в отдельном процессе (`--transport server`). Результат —
+JSON с пропускной способностью и p50/p95/p99 по каждой операции; ошибкой
+считается любой ответ, отличный от ожидаемого для операции статуса и
+адреса перенаправления. С `--compare` дополнительно печатается разница с
+предыдущим запуском.
+Работает без сети; последовательность операций задаётся `--seed`.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench'  # nosec B105 - пароль тестовых пользователей
+
+DEFAULT_MIX = 'list=30,view=30,search=10,edit=10,create=8,delete=4,login=5,role=3'
+
+# Ожидаемый ответ каждой операции: статус и путь из Location. Приложение
+# сообщает о большинстве неудач перенаправлением (неверный пароль — снова
+# форма входа со статусом 200, чужая или удалённая заявка — на /tickets),
+# поэтому одной проверки статуса >= 400 недостаточно
+EXPECTED = {
+    'login': (302, '/'),
+    'list': (200, None),
+    'view': (200, None),
+    'search': (200, None),
+    'create': (302, '/tickets'),
+    'edit': (302, '/tickets'),
+    'delete': (302, '/tickets'),
+    'role': (302, '/users'),
+}
+
+WORDS = ('интернет', 'компьютер', 'ноутбук', 'принтер', 'монитор', 'сеть', 'пароль', 'почта', 'сервер',
+         'скорость', 'ошибка', 'доступ', 'диск', 'телефон', 'драйвер', 'картридж', 'роутер', 'отчёт')
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError('unknown operation: %s' % name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def import_app(backend, sqlite_path):
+    os.environ.update(USER1_PASSWORD=PASSWORD, ADMIN_PASSWORD=PASSWORD, STORAGE_BACKEND=backend)
+    if sqlite_path:
+        os.environ['SQLITE_PATH'] = sqlite_path
+    sys.path.insert(0, ROOT)
+    import app as ticket_app
+    return ticket_app
+
+
+def seed(ticket_app, users_count, tickets_count, rng):
+    """Создаёт пользователей и заявки напрямую в хранилищах; возвращает их описание."""
+    # Один хэш на всех: иначе заполнение упрётся в KDF
+    hashed = ticket_app.password_hasher.hash(PASSWORD)
+    accounts = [ticket_app.users.create('bench%d' % i, hashed) for i in range(users_count)]
+    accounts = [{'id': user.id, 'username': user.username} for user in accounts]
+
+    items = []
+    for i in range(tickets_count):
+        items.append({
+            'title': '%s %s' % (rng.choice(WORDS), rng.choice(WORDS)),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(6)),
+            'author': accounts[i % users_count]['username'],
+        })
+
+    owned = {account['username']: [] for account in accounts}
+    for ticket in ticket_app.tickets.create_many(items):
+        ticket_app.ticket_changed(ticket)
+        owned[ticket['author']].append(ticket['id'])
+    return {'accounts': accounts, 'tickets': owned}
+
+
+def serve(queue, backend, sqlite_path, users_count, tickets_count, seed_value):
+    from wsgi_server import run_server
+
+    ticket_app = import_app(backend, sqlite_path)
+    fixture = seed(ticket_app, users_count, tickets_count, random.Random(seed_value))  # nosec B311
+    run_server(ticket_app, lambda port: queue.put((port, fixture)), keep_alive=True)
+
+
+def redirect_path(location):
+    return urllib.parse.urlsplit(location).path if location else None
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Flask, без сети."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, form=None):
+        """Статус ответа и путь перенаправления (None, если его нет)."""
+        response = self._client.open(path, method=method, data=form)
+        return response.status_code, redirect_path(response.location)
+
+
+class HTTPTransport:
+    """Запросы к локальному серверу по HTTP/1.1 с keep-alive и cookie сессии."""
+
+    def __init__(self, port):
+        self._port = port
+        self._conn = None
+        self._cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection('127.0.0.1', self._port, timeout=60)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if attempt == 2:
+                    raise
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self._cookie = cookie.split(';', 1)[0]
+        return response.status, redirect_path(response.getheader('Location'))
+
+
+class Worker:
+    def __init__(self, user, admin, account, ticket_ids, accounts, rng):
+        self.user = user
+        self.admin = admin
+        self.account = account
+        self.ticket_ids = ticket_ids
+        self.accounts = accounts
+        self.rng = rng
+
+    def login(self):
+        return self.user.request('POST', '/login', {'username': self.account['username'], 'password': PASSWORD})
+
+    def list(self):
+        return self.user.request('GET', '/tickets')
+
+    def view(self):
+        if not self.ticket_ids:
+            return None
+        return self.user.request('GET', '/tickets/%d' % self.rng.choice(self.ticket_ids))
+
+    def search(self):
+        return self.user.request('GET', '/tickets/search?' + urllib.parse.urlencode({'q': self.rng.choice(WORDS)}))
+
+    def create(self):
+        return self.user.request('POST', '/tickets/create',
+                                 {'title': self.rng.choice(WORDS), 'description': ' '.join(self.rng.sample(WORDS, 4))})
+
+    def edit(self):
+        if not self.ticket_ids:
+            return None
+        return self.user.request('POST', '/tickets/edit/%d' % self.rng.choice(self.ticket_ids),
+                                 {'title': self.rng.choice(WORDS), 'description': ' '.join(self.rng.sample(WORDS, 4))})
+
+    def delete(self):
+        if not self.ticket_ids:
+            return None
+        ticket_id = self.ticket_ids.pop(self.rng.randrange(len(self.ticket_ids)))
+        return self.user.request('POST', '/tickets/delete/%d' % ticket_id)
+
+    def role(self):
+        # Роль остаётся 'user', чтобы не менять видимость заявок по ходу теста
+        account = self.rng.choice(self.accounts)
+        return self.admin.request('POST', '/users/update_role/%d' % account['id'], {'role': 'user'})
+
+
+OPERATIONS = ('login', 'list', 'view', 'search', 'create', 'edit', 'delete', 'role')
+
+
+def run_worker(worker, mix, deadline, requests, samples, errors):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    done = 0
+    while (requests and done < requests) or (not requests and time.perf_counter() < deadline):
+        name = worker.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            outcome = getattr(worker, name)()
+        except (http.client.HTTPException, OSError):
+            outcome = (599, None)
+        elapsed = time.perf_counter() - start
+        if outcome is None:
+            continue
+
+        samples[name].append(elapsed * 1000)
+        if outcome != EXPECTED[name]:
+            errors[name] += 1
+        done += 1
+
+
+def summarize(samples, errors, duration):
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        if not values:
+            continue
+        cuts = statistics.quantiles(values, n=100, method='inclusive') if len(values) > 1 else [values[0]] * 99
+        endpoints[name] = {
+            'count': len(values),
+            'errors': errors[name],
+            'throughput_rps': len(values) / duration,
+            'mean_ms': statistics.fmean(values),
+            'p50_ms': cuts[49],
+            'p95_ms': cuts[94],
+            'p99_ms': cuts[98],
+            'max_ms': max(values),
+        }
+
+    total = sum(endpoint['count'] for endpoint in endpoints.values())
+    return {
+        'total': {'requests': total, 'errors': sum(errors.values()),
+                  'duration_s': duration, 'throughput_rps': total / duration},
+        'endpoints': endpoints,
+    }
+
+
+def compare(baseline, result):
+    print('%-8s %12s %12s %9s %12s %12s %9s' % (
+        'op', 'p50 before', 'p50 after', 'change', 'p99 before', 'p99 after', 'change'), file=sys.stderr)
+    for name, after in result['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        print('%-8s %12.2f %12.2f %+8.1f%% %12.2f %12.2f %+8.1f%%' % (
+            name, before['p50_ms'], after['p50_ms'], 100 * (after['p50_ms'] / before['p50_ms'] - 1),
+            before['p99_ms'], after['p99_ms'], 100 * (after['p99_ms'] / before['p99_ms'] - 1)), file=sys.stderr)
+    print('throughput: %.1f -> %.1f req/s' % (
+        baseline['total']['throughput_rps'], result['total']['throughput_rps']), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tickets', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--requests', type=int, default=0, help='requests per worker instead of --duration')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--transport', choices=('client', 'server'), default='client')
+    parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.TemporaryDirectory(prefix='loadtest-')
+    sqlite_path = os.path.join(workdir.name, 'helpdesk.db') if args.backend == 'sqlite' else None
+
+    server = None
+    if args.transport == 'server':
+        queue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(
+            queue, args.backend, sqlite_path, args.users, args.tickets, args.seed))
+        server.start()
+        port, fixture = queue.get(timeout=600)
+
+        def transport():
+            return HTTPTransport(port)
+    else:
+        ticket_app = import_app(args.backend, sqlite_path)
+        fixture = seed(ticket_app, args.users, args.tickets, random.Random(args.seed))  # nosec B311
+
+        def transport():
+            return ClientTransport(ticket_app.app)
+
+    try:
+        accounts = fixture['accounts']
+        sharing = {}
+        workers = []
+        for n in range(args.concurrency):
+            account = accounts[n % len(accounts)]
+            share = (args.concurrency - n % len(accounts) + len(accounts) - 1) // len(accounts)
+            index = sharing.setdefault(account['username'], 0)
+            sharing[account['username']] += 1
+            ticket_ids = fixture['tickets'][account['username']][index::share]
+            worker = Worker(transport(), transport(), account, ticket_ids, accounts,
+                            random.Random(args.seed * 1000 + n))  # nosec B311
+            if worker.login() != EXPECTED['login'] or worker.admin.request(
+                    'POST', '/login', {'username': 'admin', 'password': PASSWORD}) != EXPECTED['login']:
+                raise SystemExit('Could not log in as %s and admin' % account['username'])
+            workers.append(worker)
+
+        samples = {name: [] for name in args.mix}
+        errors = {name: 0 for name in args.mix}
+        per_worker = [({name: [] for name in args.mix}, {name: 0 for name in args.mix}) for _ in workers]
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=run_worker, args=(
+            worker, args.mix, start + args.duration, args.requests, worker_samples, worker_errors))
+            for worker, (worker_samples, worker_errors) in zip(workers, per_worker)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        for worker_samples, worker_errors in per_worker:
+            for name in args.mix:
+                samples[name].extend(worker_samples[name])
+                errors[name] += worker_errors[name]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+        workdir.cleanup()
+
+    result = {
+        'config': {
+            'users': args.users, 'tickets': args.tickets, 'concurrency': args.concurrency,
+            'duration': args.duration, 'requests': args.requests, 'mix': args.mix,
+            'transport': args.transport, 'backend': args.backend, 'seed': args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+    }
+    result.update(summarize(samples, errors, duration))
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""Локальный WSGI-сервер для бенчмарков, запускаемый в отдельном процессе."""
+import logging
+import signal
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+def run_server(ticket_app, ready, keep_alive=False):
+    """Обслуживает ticket_app на свободном порту до SIGTERM.
+
+    ready(port) вызывается, когда сервер уже слушает порт. При остановке
+    закрывается и пул хэширования паролей, иначе его процессы переживут
+    сервер.
+    """
+    def stop(signum, frame):
+        raise SystemExit
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    signal.signal(signal.SIGTERM, stop)
+    handler = KeepAliveHandler if keep_alive else WSGIRequestHandler
+    server = make_server('127.0.0.1', 0, ticket_app.app, threaded=True, request_handler=handler)
+    ready(server.server_port)
+    try:
+        server.serve_forever()
+    finally:
+        ticket_app.password_hasher.shutdown()
@@ -0,0 +1,226 @@
+import bisect
+import cProfile
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from flask import g, request
+from flask.signals import before_render_template, template_rendered
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Методы хранилищ, время которых измеряется (генераторы вроде scan не
+# измеряются: вызов только создаёт итератор)
+STORE_METHODS = frozenset((
+    'get', 'get_by_username', 'all', 'by_author', 'by_status', 'page', 'create', 'update', 'delete',
+    'create_many', 'update_many', 'delete_many', 'set_role', 'set_password', 'seed', 'search',
+))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    pairs += ['%s="%s"' % (name, _escape(value)) for name, value in extra]
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+
+        for label_values, counts, total, count in sorted(series):
+            for bound, cumulative in zip(self.buckets + ('+Inf',), itertools.accumulate(counts)):
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _format_labels(self.labels, label_values, (('le', bound),)), cumulative))
+            labels = _format_labels(self.labels, label_values)
+            lines.append('%s_sum%s %s' % (self.name, labels, _format_value(total)))
+            lines.append('%s_count%s %d' % (self.name, labels, count))
+        return lines
+
+
+class CallbackMetric:
+    """Счётчик или gauge, значение которого берётся из функции при каждом экспорте."""
+
+    def __init__(self, name, help, type, callback, labels=()):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type)]
+        for label_values, value in self.callback():
+            lines.append('%s%s %s' % (self.name, _format_labels(self.labels, label_values), _format_value(value)))
+        return lines
+
+
+class InstrumentedStore:
+    """Обёртка хранилища, замеряющая время вызовов его методов."""
+
+    def __init__(self, store, name, histogram):
+        self._store = store
+        self._name = name
+        self._histogram = histogram
+
+    def __len__(self):
+        return len(self._store)
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __getattr__(self, attribute):
+        value = getattr(self._store, attribute)
+        if attribute not in STORE_METHODS:
+            return value
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self._histogram.observe(time.perf_counter() - start, self._name, attribute)
+
+        return timed
+
+
+class SlowRequestProfiler:
+    """Профилирует каждый N-й запрос и сохраняет профили самых медленных.
+
+    В каталоге хранится не больше `keep` файлов .prof; профиль запроса,
+    оказавшегося медленнее самого быстрого из сохранённых, вытесняет его.
+    Одновременно профилируется только один запрос.
+    """
+
+    def __init__(self, directory, every=100, keep=10):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self._counter = itertools.count(1)
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self._slowest = []
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if next(self._counter) % self.every or not self._active.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Уже работает другой профилировщик
+            self._active.release()
+            return None
+        return profile
+
+    def stop(self, profile, duration, endpoint):
+        profile.disable()
+        self._active.release()
+
+        with self._lock:
+            if len(self._slowest) >= self.keep and duration <= self._slowest[0][0]:
+                return
+
+            path = os.path.join(self.directory, '%.6f_%s_%d.prof' % (duration, endpoint, time.time_ns()))
+            profile.dump_stats(path)
+            heapq.heappush(self._slowest, (duration, path))
+            if len(self._slowest) > self.keep:
+                _, evicted = heapq.heappop(self._slowest)
+                os.remove(evicted)
+
+
+class Metrics:
+    """Метрики приложения в текстовом формате Prometheus.
+
+    Время запросов измеряется в before_request/after_request, профиль
+    запроса закрывается в teardown_request (он выполняется и при
+    исключении, иначе профилировщик остался бы занят навсегда), время
+    рендеринга шаблонов — по сигналам Flask, время обращений к хранилищам —
+    обёрткой InstrumentedStore. На запрос приходится несколько вызовов
+    perf_counter и по одной короткой блокировке на наблюдение.
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method', 'status'))
+        self.render_duration = Histogram(
+            'template_render_duration_seconds', 'Jinja template render time.', ('template',))
+        self.store_duration = Histogram(
+            'store_call_duration_seconds', 'Storage call latency.', ('store', 'method'))
+        self._metrics = [self.request_duration, self.render_duration, self.store_duration]
+
+    def add(self, name, help, type, callback, labels=()):
+        self._metrics.append(CallbackMetric(name, help, type, callback, labels))
+
+    def instrument(self, store, name):
+        return InstrumentedStore(store, name, self.store_duration)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_profile = self.profiler.start() if self.profiler else None
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is not None:
+            self.request_duration.observe(
+                time.perf_counter() - start, request.endpoint or 'unmatched', request.method, response.status_code)
+        return response
+
+    def _teardown_request(self, exception):
+        start = g.pop('metrics_start', None)
+        profile = g.pop('metrics_profile', None)
+        if profile is not None:
+            self.profiler.stop(profile, time.perf_counter() - start, request.endpoint or 'unmatched')
+
+    def _before_render(self, sender, template, context, **extra):
+        g.metrics_render_start = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        start = g.pop('metrics_render_start', None)
+        if start is not None:
+            self.render_duration.observe(time.perf_counter() - start, template.name)
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import threading
+
+from flask import Response, request
+
+from cache import LRUCache
+
+
+class PageCache:
+    """Кэш отрендеренных страниц с инвалидацией по версиям данных.
+
+    Каждое изменение заявок автора увеличивает его версию и общую версию
+    (её используют страницы администратора). Версии входят в ключ, поэтому
+    устаревшие страницы просто перестают запрашиваться и вытесняются из LRU.
+    ETag вычисляется из того же ключа, так что на If-None-Match можно
+    ответить 304, ничего не рендеря.
+    """
+
+    def __init__(self, maxsize=256):
+        self.enabled = maxsize > 0
+        self.pages = LRUCache(maxsize) if self.enabled else None
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._version = 0
+        self._versions = {}
+        # Версии начинаются с нуля при каждом запуске, поэтому ETag включает
+        # метку процесса, иначе после перезапуска совпали бы старые ETag
+        self._instance = os.urandom(8).hex()
+
+    def version(self, author=None):
+        if author is None:
+            return self._version
+        return self._versions.get(author, 0)
+
+    def bump(self, author):
+        with self._lock:
+            self._version += 1
+            self._versions[author] = self._versions.get(author, 0) + 1
+
+    def etag(self, key):
+        return hashlib.sha256(repr((self._instance,) + key).encode()).hexdigest()[:32]
+
+    def respond(self, key, render):
+        if not self.enabled:
+            return render()
+
+        etag = self.etag(key)
+        if request.if_none_match.contains(etag):
+            self.not_modified += 1
+            response = Response(status=304)
+        else:
+            body = self.pages.get(etag)
+            if body is None:
+                body = render()
+                self.pages.set(etag, body)
+            response = Response(body)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
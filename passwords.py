@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cache import LRUCache
+
+SALT_SIZE = 16
+
+# Стоимость по умолчанию: для scrypt — параметр N (память ~128 * N * r байт),
+# для PBKDF2 — число итераций
+DEFAULT_COST = {'scrypt': 2 ** 14, 'pbkdf2_sha256': 600000}
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def _derive(method, cost, password, salt):
+    if method == 'scrypt':
+        return hashlib.scrypt(password.encode(), salt=salt, n=cost, r=SCRYPT_R, p=SCRYPT_P,
+                              maxmem=256 * cost * SCRYPT_R)
+    if method == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, cost)
+    raise ValueError('Unknown password hash method: %s' % method)
+
+
+def hash_password(password, method='scrypt', cost=None):
+    """Хэш в формате 'метод$стоимость$соль$ключ' (соль и ключ в hex)."""
+    cost = cost or DEFAULT_COST[method]
+    salt = os.urandom(SALT_SIZE)
+    return '%s$%d$%s$%s' % (method, cost, salt.hex(), _derive(method, cost, password, salt).hex())
+
+
+def is_hashed(stored):
+    return stored.split('$', 1)[0] in DEFAULT_COST
+
+
+def check_password(stored, password):
+    # Пароли, сохранённые до перехода на хэши, сравниваются как есть
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    method, cost, salt, key = stored.split('$')
+    return hmac.compare_digest(bytes.fromhex(key), _derive(method, int(cost), password, bytes.fromhex(salt)))
+
+
+class PasswordHasher:
+    """Хэширование и проверка паролей в пуле воркеров.
+
+    Медленный KDF выполняется в отдельном пуле потоков или процессов,
+    поэтому всплеск входов занимает не больше `workers` ядер, а остальные
+    запросы продолжают обслуживаться. Недавние успешные проверки
+    запоминаются на `cache_ttl` секунд, чтобы повторный вход не пересчитывал
+    KDF.
+    """
+
+    def __init__(self, method='scrypt', cost=None, pool='thread', workers=2, cache_size=1024, cache_ttl=60):
+        self.method = method
+        self.cost = cost or DEFAULT_COST[method]
+        executor = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+        self._executor = executor(max_workers=workers)
+        self.verified = LRUCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl else None
+        # Для несуществующего пользователя тоже считаем KDF, чтобы время
+        # ответа не выдавало, есть ли такое имя
+        self._dummy = hash_password('', method, self.cost)
+
+    def hash(self, password):
+        return self._executor.submit(hash_password, password, self.method, self.cost).result()
+
+    def needs_rehash(self, stored):
+        if not is_hashed(stored):
+            return True
+        method, cost = stored.split('$')[:2]
+        return method != self.method or int(cost) != self.cost
+
+    def verify(self, stored, password):
+        if stored is None:
+            self._executor.submit(check_password, self._dummy, password).result()
+            return False
+
+        key = None
+        if self.verified is not None:
+            key = hashlib.sha256(stored.encode() + b'\0' + password.encode()).digest()
+            if self.verified.get(key):
+                return True
+
+        verified = self._executor.submit(check_password, stored, password).result()
+        if verified and key is not None:
+            self.verified.set(key, True)
+        return verified
+
+    def shutdown(self):
+        self._executor.shutdown()
@@ -0,0 +1,253 @@
+import functools
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+STOP_WORDS = frozenset((
+    'а', 'в', 'во', 'да', 'для', 'до', 'же', 'за', 'и', 'из', 'или', 'к', 'ко', 'как', 'на', 'не',
+    'но', 'о', 'об', 'от', 'по', 'при', 'с', 'со', 'то', 'у', 'что', 'это',
+    'a', 'an', 'and', 'in', 'is', 'of', 'on', 'or', 'the', 'to',
+))
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(after_a=(), other=()):
+    """Окончание -> допустимо ли оно только после «а» или «я» (окончания из after_a)."""
+    endings = dict.fromkeys(other, False)
+    endings.update(dict.fromkeys(after_a, True))
+    return endings
+
+
+# Классы окончаний стеммера Snowball для русского языка
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+    'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PERFECTIVE_GERUND = _endings(('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVAL = _endings(
+    [participle + ending for participle in ('ем', 'нн', 'вш', 'ющ', 'щ') for ending in ADJECTIVE],
+    ADJECTIVE + tuple(participle + ending for participle in ('ивш', 'ывш', 'ующ') for ending in ADJECTIVE))
+REFLEXIVE = _endings(other=('ся', 'сь'))
+VERB = _endings(
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+     'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = _endings(other=(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+SUPERLATIVE = _endings(other=('ейш', 'ейше'))
+DERIVATIONAL = _endings(other=('ост', 'ость'))
+MAX_ENDING_LENGTH = max(map(len, ADJECTIVAL))
+
+# Совпадение в заголовке весит больше, чем в описании
+TITLE_WEIGHT = 2
+
+
+def _region(word, start):
+    """Начало области после первой согласной, следующей за гласной (R1/R2 в Snowball)."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def _ending(word, start, endings):
+    """Длина самого длинного окончания из endings, лежащего в word[start:], или 0."""
+    for length in range(min(MAX_ENDING_LENGTH, len(word) - start), 0, -1):
+        after_a = endings.get(word[-length:])
+        if after_a is None:
+            continue
+        if not after_a or (len(word) - length > start and word[-length - 1] in 'ая'):
+            return length
+    return 0
+
+
+def _cut(word, start, endings):
+    size = _ending(word, start, endings)
+    return word[:len(word) - size], size
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    """Русский стеммер Snowball: «интернет», «интернета» и «интернету» дают одну основу.
+
+    Окончания ищутся только в области RV (после первой гласной), поэтому
+    короткие слова и основы вроде «интернет» не обрезаются. Слова без
+    кириллицы возвращаются как есть.
+    """
+    if not CYRILLIC_RE.search(word):
+        return word
+
+    rv = next((position + 1 for position, char in enumerate(word) if char in VOWELS), len(word))
+    r2 = _region(word, _region(word, 0))
+
+    word, size = _cut(word, rv, PERFECTIVE_GERUND)
+    if not size:
+        word, _ = _cut(word, rv, REFLEXIVE)
+        for endings in (ADJECTIVAL, VERB, NOUN):
+            word, size = _cut(word, rv, endings)
+            if size:
+                break
+
+    if word.endswith('и') and len(word) > rv:
+        word = word[:-1]
+    word, _ = _cut(word, r2, DERIVATIONAL)
+    word, _ = _cut(word, rv, SUPERLATIVE)
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) > rv:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    words = WORD_RE.findall(text.casefold().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOP_WORDS]
+
+
+class SearchIndex:
+    """Инвертированный индекс по заголовкам и описаниям заявок.
+
+    Обновляется по одной заявке при создании, изменении и удалении, так что
+    поиск не перебирает все заявки. Результаты ранжируются по TF-IDF;
+    для каждой заявки хранится автор, чтобы применять те же правила
+    видимости, что и в списке заявок.
+
+    Кроме словаря «заявка -> частота» для каждого слова хранятся множества
+    заявок с одинаковой частотой. Поиск перебирает сочетания частот от
+    наибольшей оценки к меньшей и останавливается, набрав `limit` заявок,
+    поэтому частые слова не заставляют пересекать и оценивать все их заявки.
+    """
+
+    def __init__(self, tickets=()):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._impacts = {}
+        self._terms = {}
+        self._authors = {}
+        self._by_author = {}
+        for ticket in tickets:
+            self.add(ticket)
+
+    def __len__(self):
+        return len(self._terms)
+
+    @staticmethod
+    def _term_frequencies(ticket):
+        terms = Counter(tokenize(ticket['description']))
+        for term in tokenize(ticket['title']):
+            terms[term] += TITLE_WEIGHT
+        return terms
+
+    def _remove(self, ticket_id):
+        for term in self._terms.pop(ticket_id, ()):
+            postings = self._postings[term]
+            frequency = postings.pop(ticket_id)
+            if not postings:
+                del self._postings[term]
+            impacts = self._impacts[term]
+            impacts[frequency].discard(ticket_id)
+            if not impacts[frequency]:
+                del impacts[frequency]
+                if not impacts:
+                    del self._impacts[term]
+        author = self._authors.pop(ticket_id, None)
+        if author is not None:
+            ticket_ids = self._by_author[author]
+            ticket_ids.discard(ticket_id)
+            if not ticket_ids:
+                del self._by_author[author]
+
+    def add(self, ticket):
+        terms = self._term_frequencies(ticket)
+        with self._lock:
+            self._remove(ticket['id'])
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[ticket['id']] = frequency
+                self._impacts.setdefault(term, {}).setdefault(frequency, set()).add(ticket['id'])
+            self._terms[ticket['id']] = tuple(terms)
+            self._authors[ticket['id']] = ticket['author']
+            self._by_author.setdefault(ticket['author'], set()).add(ticket['id'])
+
+    def remove(self, ticket_id):
+        with self._lock:
+            self._remove(ticket_id)
+
+    def search(self, query, author=None, limit=50):
+        """Id заявок, содержащих все слова запроса, от наиболее релевантных."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+
+            total = len(self._terms)
+            weights = [math.log(1 + total / len(items)) for items in postings]
+            author_ids = None
+            if author is not None:
+                author_ids = self._by_author.get(author)
+                if not author_ids:
+                    return []
+                # У автора обычно меньше заявок, чем у любого слова: проверяем
+                # каждую его заявку по словарям слов
+                if len(author_ids) <= min(map(len, postings)):
+                    return self._search_ids(author_ids, postings, weights, limit)
+
+            return self._search_impacts([self._impacts[term] for term in terms], weights, author_ids, limit)
+
+    @staticmethod
+    def _search_ids(ticket_ids, postings, weights, limit):
+        scored = []
+        for ticket_id in ticket_ids:
+            score = 0.0
+            for items, weight in zip(postings, weights):
+                frequency = items.get(ticket_id)
+                if frequency is None:
+                    break
+                score += frequency * weight
+            else:
+                scored.append((score, ticket_id))
+        return [ticket_id for _, ticket_id in heapq.nlargest(limit, scored)]
+
+    @staticmethod
+    def _search_impacts(impacts, weights, author_ids, limit):
+        # Сочетание частот (по одной на слово) задаёт оценку всех заявок,
+        # в которых оно встречается. Сочетания обходятся от лучшего к худшему
+        # через кучу: из каждого берутся соседние, где одна частота на шаг ниже
+        levels = [sorted(items, reverse=True) for items in impacts]
+
+        def score(position):
+            return sum(levels[term][step] * weight for term, (step, weight) in enumerate(zip(position, weights)))
+
+        start = (0,) * len(levels)
+        heap = [(-score(start), start)]
+        seen = {start}
+        found = []
+        while heap and len(found) < limit:
+            _, position = heapq.heappop(heap)
+            buckets = sorted((items[levels[term][step]] for term, (items, step) in enumerate(zip(impacts, position))),
+                             key=len)
+            ticket_ids = buckets[0].intersection(*buckets[1:]) if len(buckets) > 1 else buckets[0]
+            if author_ids is not None:
+                ticket_ids = ticket_ids & author_ids
+            # При равной оценке выше более новые заявки
+            found.extend(heapq.nlargest(limit - len(found), ticket_ids))
+
+            for term in range(len(position)):
+                if position[term] + 1 < len(levels[term]):
+                    following = position[:term] + (position[term] + 1,) + position[term + 1:]
+                    if following not in seen:
+                        seen.add(following)
+                        heapq.heappush(heap, (-score(following), following))
+        return found
@@ -0,0 +1,363 @@
+import queue
+import sqlite3
+import threading
+
+from search import TITLE_WEIGHT, tokenize
+from storage import User
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        password TEXT,
+        role TEXT NOT NULL DEFAULT 'user'
+    )''',
+    '''CREATE TABLE IF NOT EXISTS tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open',
+        author TEXT NOT NULL
+    )''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username)',
+    # Составные индексы: выборка страницы автора или статуса — один проход
+    # по диапазону индекса, начиная с id > after
+    'CREATE INDEX IF NOT EXISTS idx_tickets_author_id ON tickets (author, id)',
+    'CREATE INDEX IF NOT EXISTS idx_tickets_status_id ON tickets (status, id)',
+    # Полнотекстовый индекс по заголовку и описанию. Таблица хранит только
+    # индекс (content='tickets'), а триггеры обновляют его в той же
+    # транзакции, что и заявку, так что все воркеры сразу видят изменения.
+    # Как и tokenize(), индекс не различает «ё» и «е»
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+        title, description, content='tickets', content_rowid='id'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+        INSERT INTO tickets_fts (rowid, title, description) VALUES (
+            new.id, replace(replace(new.title, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.description, 'ё', 'е'), 'Ё', 'Е'));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+        INSERT INTO tickets_fts (tickets_fts, rowid, title, description) VALUES (
+            'delete', old.id, replace(replace(old.title, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(old.description, 'ё', 'е'), 'Ё', 'Е'));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS tickets_fts_update AFTER UPDATE OF title, description ON tickets
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+        INSERT INTO tickets_fts (tickets_fts, rowid, title, description) VALUES (
+            'delete', old.id, replace(replace(old.title, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(old.description, 'ё', 'е'), 'Ё', 'Е'));
+        INSERT INTO tickets_fts (rowid, title, description) VALUES (
+            new.id, replace(replace(new.title, 'ё', 'е'), 'Ё', 'Е'),
+            replace(replace(new.description, 'ё', 'е'), 'Ё', 'Е'));
+    END''',
+)
+
+TICKET_COLUMNS = ('title', 'description', 'status', 'author')
+
+# Обновляются только переданные поля: для остальных параметр равен NULL
+UPDATE_QUERY = (
+    'UPDATE tickets SET title = COALESCE(:title, title), '
+    'description = COALESCE(:description, description), '
+    'status = COALESCE(:status, status), author = COALESCE(:author, author) '
+    'WHERE id = :id'
+)
+
+# Keyset-пагинация: страница начинается сразу после последнего показанного id,
+# поэтому её стоимость не зависит от номера страницы (в отличие от OFFSET).
+# Отдельный запрос на каждое сочетание фильтров (есть ли автор, есть ли
+# статус), иначе SQLite не может выбрать индекс по author или status
+PAGE_QUERIES = {
+    (False, False): 'SELECT id, title, description, status, author FROM tickets '
+                    'WHERE id > :after ORDER BY id LIMIT :limit',
+    (True, False): 'SELECT id, title, description, status, author FROM tickets '
+                   'WHERE author = :author AND id > :after ORDER BY id LIMIT :limit',
+    (False, True): 'SELECT id, title, description, status, author FROM tickets '
+                   'WHERE status = :status AND id > :after ORDER BY id LIMIT :limit',
+    (True, True): 'SELECT id, title, description, status, author FROM tickets '
+                  'WHERE author = :author AND status = :status AND id > :after ORDER BY id LIMIT :limit',
+}
+
+
+# Слова запроса приводятся к основам тем же стеммером, что и в SearchIndex,
+# и ищутся как префиксы: «интернета» -> интернет* находит и «интернет», и
+# «интернету». Меньшее значение bm25 означает более релевантную заявку
+SEARCH_QUERIES = {
+    False: 'SELECT rowid FROM tickets_fts WHERE tickets_fts MATCH :query '
+           'ORDER BY bm25(tickets_fts, :title_weight, 1.0) LIMIT :limit',
+    True: 'SELECT tickets_fts.rowid FROM tickets_fts JOIN tickets ON tickets.id = tickets_fts.rowid '
+          'WHERE tickets_fts MATCH :query AND tickets.author = :author '
+          'ORDER BY bm25(tickets_fts, :title_weight, 1.0) LIMIT :limit',
+}
+
+
+class SQLiteDatabase:
+    """Пул соединений SQLite: поток держит одно соединение до release().
+
+    База открывается в режиме WAL, поэтому несколько воркеров gunicorn
+    могут читать её одновременно с записью. Все запросы — константные
+    строки с параметрами, так что sqlite3 подготавливает их один раз и
+    берёт из кэша выражений соединения. Освобождённые соединения ждут
+    следующего потока в очереди не длиннее `pool_size`, так что
+    кэш выражений переживает запрос, а лишние соединения закрываются.
+    """
+
+    def __init__(self, path, timeout=30.0, cached_statements=128, pool_size=16):
+        self.path = path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        with self.connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        # Соединение переходит между потоками через очередь, но в каждый
+        # момент им пользуется только один поток
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               cached_statements=self.cached_statements, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def release(self):
+        """Возвращает соединение текущего потока в пул.
+
+        Сервер разработки создаёт поток на каждое подключение, поэтому без
+        этого соединения копились бы вместе с файловыми дескрипторами.
+        Соединение, для которого в пуле нет места, закрывается.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            with self._lock:
+                self._connections.remove(conn)
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = queue.LifoQueue(maxsize=self._idle.maxsize)
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class SQLiteUserStore:
+    def __init__(self, database):
+        self.database = database
+
+    def __len__(self):
+        return self.database.connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    @staticmethod
+    def _user(row):
+        if row is None:
+            return None
+        return User(id=row['id'], username=row['username'], password=row['password'], role=row['role'])
+
+    def seed(self, users):
+        with self.database.connection() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (id, username, password, role) VALUES (?, ?, ?, ?)',
+                [(user.id, user.username, user.password, user.role) for user in users])
+
+    def get(self, user_id):
+        row = self.database.connection().execute(
+            'SELECT id, username, password, role FROM users WHERE id = ?', (user_id,)).fetchone()
+        return self._user(row)
+
+    def get_by_username(self, username):
+        row = self.database.connection().execute(
+            'SELECT id, username, password, role FROM users WHERE username = ?', (username,)).fetchone()
+        return self._user(row)
+
+    def all(self):
+        rows = self.database.connection().execute(
+            'SELECT id, username, password, role FROM users ORDER BY id')
+        return [self._user(row) for row in rows]
+
+    def create(self, username, password, role='user'):
+        try:
+            with self.database.connection() as conn:
+                cursor = conn.execute(
+                    'INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                    (username, password, role))
+        except sqlite3.IntegrityError:
+            return None
+        return User(id=cursor.lastrowid, username=username, password=password, role=role)
+
+    def set_role(self, user_id, role):
+        with self.database.connection() as conn:
+            conn.execute('UPDATE users SET role = ? WHERE id = ?', (role, user_id))
+        return self.get(user_id)
+
+    def set_password(self, user_id, password):
+        with self.database.connection() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE id = ?', (password, user_id))
+        return self.get(user_id)
+
+
+class SQLiteTicketStore:
+    def __init__(self, database):
+        self.database = database
+
+    def __len__(self):
+        return self.database.connection().execute('SELECT COUNT(*) FROM tickets').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def _select(self, query, params=()):
+        return [dict(row) for row in self.database.connection().execute(query, params)]
+
+    def seed(self, tickets):
+        with self.database.connection() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO tickets (id, title, description, status, author) '
+                'VALUES (:id, :title, :description, :status, :author)', tickets)
+
+    def get(self, ticket_id):
+        tickets = self._select(
+            'SELECT id, title, description, status, author FROM tickets WHERE id = ?', (ticket_id,))
+        return tickets[0] if tickets else None
+
+    def all(self):
+        return self._select('SELECT id, title, description, status, author FROM tickets ORDER BY id')
+
+    def by_author(self, author):
+        return self._select(
+            'SELECT id, title, description, status, author FROM tickets WHERE author = ? ORDER BY id',
+            (author,))
+
+    def by_status(self, status):
+        return self._select(
+            'SELECT id, title, description, status, author FROM tickets WHERE status = ? ORDER BY id',
+            (status,))
+
+    def scan(self, after=0, author=None, status=None):
+        """Заявки с id > after по возрастанию id; строки читаются из курсора по мере обхода."""
+        query = PAGE_QUERIES[author is not None, status is not None]
+        rows = self.database.connection().execute(query, {
+            'after': after, 'author': author, 'status': status, 'limit': -1})
+        for row in rows:
+            yield dict(row)
+
+    def page(self, after=0, limit=50, author=None, status=None):
+        query = PAGE_QUERIES[author is not None, status is not None]
+        return self._select(query, {'after': after, 'author': author, 'status': status, 'limit': limit})
+
+    def search(self, query, author=None, limit=50):
+        """Id заявок, содержащих все слова запроса, от наиболее релевантных."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        match = ' '.join('"%s"*' % term for term in sorted(terms))
+        rows = self.database.connection().execute(SEARCH_QUERIES[author is not None], {
+            'query': match, 'author': author, 'title_weight': TITLE_WEIGHT, 'limit': limit})
+        return [row[0] for row in rows]
+
+    def create(self, title, description, author, status='open'):
+        with self.database.connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO tickets (title, description, status, author) VALUES (?, ?, ?, ?)',
+                (title, description, status, author))
+        return {'id': cursor.lastrowid, 'title': title, 'description': description,
+                'status': status, 'author': author}
+
+    def update(self, ticket_id, **fields):
+        unknown = set(fields) - set(TICKET_COLUMNS)
+        if unknown:
+            raise ValueError('Unknown ticket fields: %s' % ', '.join(sorted(unknown)))
+
+        params = dict.fromkeys(TICKET_COLUMNS)
+        params.update(fields, id=ticket_id)
+        with self.database.connection() as conn:
+            conn.execute(UPDATE_QUERY, params)
+        return self.get(ticket_id)
+
+    def delete(self, ticket_id):
+        ticket = self.get(ticket_id)
+        if ticket is None:
+            return None
+
+        with self.database.connection() as conn:
+            conn.execute('DELETE FROM tickets WHERE id = ?', (ticket_id,))
+        return ticket
+
+    def create_many(self, items):
+        created = []
+        with self.database.connection() as conn:
+            for item in items:
+                ticket = dict(item)
+                ticket.setdefault('status', 'open')
+                cursor = conn.execute(
+                    'INSERT INTO tickets (title, description, status, author) '
+                    'VALUES (:title, :description, :status, :author)', ticket)
+                ticket['id'] = cursor.lastrowid
+                created.append(ticket)
+        return created
+
+    def update_many(self, updates):
+        """Применяет пары (id, поля) в одной транзакции: None, если какой-то заявки нет."""
+        for _, fields in updates:
+            unknown = set(fields) - set(TICKET_COLUMNS)
+            if unknown:
+                raise ValueError('Unknown ticket fields: %s' % ', '.join(sorted(unknown)))
+
+        conn = self.database.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            updated = []
+            for ticket_id, fields in updates:
+                params = dict.fromkeys(TICKET_COLUMNS)
+                params.update(fields, id=ticket_id)
+                cursor = conn.execute(UPDATE_QUERY, params)
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return None
+                updated.append(dict(conn.execute(
+                    'SELECT id, title, description, status, author FROM tickets WHERE id = ?',
+                    (ticket_id,)).fetchone()))
+        return updated
+
+    def delete_many(self, ticket_ids):
+        conn = self.database.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = []
+            for ticket_id in ticket_ids:
+                row = conn.execute(
+                    'SELECT id, title, description, status, author FROM tickets WHERE id = ?',
+                    (ticket_id,)).fetchone()
+                if row is None:
+                    conn.rollback()
+                    return None
+                conn.execute('DELETE FROM tickets WHERE id = ?', (ticket_id,))
+                deleted.append(dict(row))
+        return deleted
@@ -0,0 +1,267 @@
+import bisect
+import itertools
+import threading
+
+from flask_login import UserMixin
+
+
+class User(UserMixin):
+    def __init__(self, id, username, password, role):
+        self.id = id
+        self.username = username
+        self.password = password
+        self.role = role
+
+    def get_id(self):
+        return str(self.id)
+
+
+class UserStore:
+    """Хранилище пользователей в памяти процесса.
+
+    Пользователи индексируются по id и по имени, а новые id выдаются из
+    счётчика под блокировкой, поэтому они не повторяются ни после удаления
+    пользователей, ни при многопоточной обработке запросов.
+    """
+
+    def __init__(self, users=()):
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_username = {}
+        self._next_id = 1
+        self.seed(users)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def _insert(self, user):
+        self._by_id[user.id] = user
+        self._by_username[user.username] = user
+        self._next_id = max(self._next_id, user.id + 1)
+
+    def seed(self, users):
+        with self._lock:
+            for user in users:
+                if user.id not in self._by_id and user.username not in self._by_username:
+                    self._insert(user)
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def get_by_username(self, username):
+        return self._by_username.get(username)
+
+    def all(self):
+        return list(self._by_id.values())
+
+    def create(self, username, password, role='user'):
+        with self._lock:
+            if username in self._by_username:
+                return None
+
+            user = User(id=self._next_id, username=username, password=password, role=role)
+            self._insert(user)
+        return user
+
+    def set_role(self, user_id, role):
+        user = self._by_id.get(user_id)
+        if user is not None:
+            user.role = role
+        return user
+
+    def set_password(self, user_id, password):
+        user = self._by_id.get(user_id)
+        if user is not None:
+            user.password = password
+        return user
+
+
+class _IdIndex:
+    """Словарь заявок по id плюс отсортированный список id для keyset-обхода.
+
+    Удаление только помечает id в списке (он пропадает из словаря), сам
+    список периодически уплотняется, так что удаление остаётся O(1) в
+    среднем, а обход «после id N» начинается с bisect, а не с начала.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._ids = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._items
+
+    def get(self, ticket_id):
+        return self._items.get(ticket_id)
+
+    def values(self):
+        return self._items.values()
+
+    def add(self, ticket):
+        ticket_id = ticket['id']
+        self._items[ticket_id] = ticket
+        ids = self._ids
+        if not ids or ticket_id > ids[-1]:
+            ids.append(ticket_id)
+            return
+
+        position = bisect.bisect_left(ids, ticket_id)
+        if position == len(ids) or ids[position] != ticket_id:
+            ids.insert(position, ticket_id)
+
+    def pop(self, ticket_id):
+        ticket = self._items.pop(ticket_id, None)
+        if ticket is not None and len(self._ids) > 2 * len(self._items) + 64:
+            self._ids = [item for item in self._ids if item in self._items]
+        return ticket
+
+    def after(self, after_id):
+        ids = self._ids
+        for position in range(bisect.bisect_right(ids, after_id), len(ids)):
+            ticket = self._items.get(ids[position])
+            if ticket is not None:
+                yield ticket
+
+
+class TicketStore:
+    """Хранилище заявок с индексами по id, автору и статусу.
+
+    Заявки остаются обычными словарями (шаблоны обращаются к ним как
+    ticket['title']), но поиск, удаление и выборка по автору/статусу
+    выполняются за O(1) по словарям-индексам, а не перебором списка.
+    """
+
+    def __init__(self, tickets=()):
+        self._lock = threading.RLock()
+        self._by_id = _IdIndex()
+        self._by_author = {}
+        self._by_status = {}
+        self._next_id = 1
+        for ticket in tickets:
+            self._insert(dict(ticket))
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def seed(self, tickets):
+        with self._lock:
+            for ticket in tickets:
+                if ticket['id'] not in self._by_id:
+                    self._insert(dict(ticket))
+
+    def _insert(self, ticket):
+        self._by_id.add(ticket)
+        self._by_author.setdefault(ticket['author'], _IdIndex()).add(ticket)
+        self._by_status.setdefault(ticket['status'], _IdIndex()).add(ticket)
+        self._next_id = max(self._next_id, ticket['id'] + 1)
+
+    @staticmethod
+    def _unindex(index, key, ticket_id):
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(ticket_id)
+        if not bucket:
+            del index[key]
+
+    def get(self, ticket_id):
+        return self._by_id.get(ticket_id)
+
+    def all(self):
+        return list(self._by_id.values())
+
+    def by_author(self, author):
+        bucket = self._by_author.get(author)
+        return list(bucket.values()) if bucket else []
+
+    def by_status(self, status):
+        bucket = self._by_status.get(status)
+        return list(bucket.values()) if bucket else []
+
+    def scan(self, after=0, author=None, status=None):
+        """Заявки с id > after по возрастанию id, с фильтром по автору и статусу."""
+        # Обходим наименьший из подходящих индексов; если у автора или статуса
+        # нет ни одной заявки, результат пуст
+        index = self._by_id
+        if author is not None:
+            index = self._by_author.get(author)
+            if index is None:
+                return
+        if status is not None:
+            by_status = self._by_status.get(status)
+            if by_status is None:
+                return
+            if len(by_status) < len(index):
+                index = by_status
+
+        for ticket in index.after(after):
+            if author is not None and ticket['author'] != author:
+                continue
+            if status is not None and ticket['status'] != status:
+                continue
+            yield ticket
+
+    def page(self, after=0, limit=50, author=None, status=None):
+        return list(itertools.islice(self.scan(after, author, status), limit))
+
+    def create(self, title, description, author, status='open'):
+        with self._lock:
+            ticket = {
+                'id': self._next_id,
+                'title': title,
+                'description': description,
+                'status': status,
+                'author': author
+            }
+            self._insert(ticket)
+        return ticket
+
+    def update(self, ticket_id, **fields):
+        with self._lock:
+            ticket = self._by_id.get(ticket_id)
+            if ticket is None:
+                return None
+
+            for field, index in (('author', self._by_author), ('status', self._by_status)):
+                if field in fields and fields[field] != ticket[field]:
+                    self._unindex(index, ticket[field], ticket_id)
+                    index.setdefault(fields[field], _IdIndex()).add(ticket)
+
+            ticket.update(fields)
+        return ticket
+
+    def create_many(self, items):
+        with self._lock:
+            return [self.create(**item) for item in items]
+
+    def update_many(self, updates):
+        """Применяет пары (id, поля) целиком или никак: None, если какой-то заявки нет."""
+        with self._lock:
+            if any(ticket_id not in self._by_id for ticket_id, _ in updates):
+                return None
+            return [self.update(ticket_id, **fields) for ticket_id, fields in updates]
+
+    def delete_many(self, ticket_ids):
+        with self._lock:
+            if any(ticket_id not in self._by_id for ticket_id in ticket_ids):
+                return None
+            return [self.delete(ticket_id) for ticket_id in ticket_ids]
+
+    def delete(self, ticket_id):
+        with self._lock:
+            ticket = self._by_id.pop(ticket_id)
+            if ticket is None:
+                return None
+
+            self._unindex(self._by_author, ticket['author'], ticket_id)
+            self._unindex(self._by_status, ticket['status'], ticket_id)
+        return ticket